@@ -1253,7 +1253,8 @@ def create(vm_):
 
     data = show_instance(vm_["name"], call="action")
     log.info("Created Cloud VM '%s'", vm_["name"])
-    log.debug("'%s' VM creation details:\n%s", vm_["name"], pprint.pformat(data))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("'%s' VM creation details:\n%s", vm_["name"], pprint.pformat(data))
 
     ret.update(data)
 
@@ -379,7 +379,7 @@ def virtual_machines_list_all(**kwargs):
         salt-call azurerm_compute.virtual_machines_list_all
 
     """
-    return __salt__["azurerm_compute_virtual_machine.list_all"](**kwargs)
+    return __salt__["azurerm_compute_virtual_machine.virtual_machines_list_all"](**kwargs)
 
 
 def virtual_machines_list_available_sizes(
@@ -35,6 +35,7 @@ Azure Resource Manager (ARM) Compute Availability Set Execution Module
 """
 # Python libs
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import saltext.azurerm.utils.azurerm
 
@@ -56,6 +57,66 @@ __func_alias__ = {"list_": "list"}
 
 log = logging.getLogger(__name__)
 
+# Number of virtual machines from which their IDs are resolved by listing the resource group
+BATCH_RESOLVE_THRESHOLD = 3
+
+
+def _resolve_virtual_machine_ids(compconn, vm_names, resource_group, **kwargs):
+    """
+    Look up the IDs of the named virtual machines. Virtual machines which cannot be found are skipped.
+
+    If there are at least ``BATCH_RESOLVE_THRESHOLD`` names and ``batch_resolve`` is not disabled,
+    the virtual machines of the resource group are listed once, which only costs one request per
+    page of results. Otherwise, the lookups are run concurrently instead of one round-trip after
+    another.
+    """
+    vm_list = []
+    if not vm_names:
+        return vm_list
+
+    if kwargs.get("batch_resolve", True) and len(vm_names) >= BATCH_RESOLVE_THRESHOLD:
+        try:
+            vm_ids = {
+                vm.name.lower(): vm.id
+                for vm in compconn.virtual_machines.list(resource_group_name=resource_group)
+            }
+        except HttpResponseError as exc:
+            saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
+        else:
+            for vm_name in vm_names:
+                if vm_name.lower() in vm_ids:
+                    vm_list.append({"id": str(vm_ids[vm_name.lower()])})
+            return vm_list
+
+    # Only the ID of each virtual machine is needed, so the model is not serialized to a dictionary
+    def _get_vm_id(vm_name):
+        try:
+            return compconn.virtual_machines.get(
+                resource_group_name=resource_group, vm_name=vm_name
+            ).id
+        except (HttpResponseError, ResourceNotFoundError) as exc:
+            saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(16, len(vm_names))) as executor:
+        for vm_id in executor.map(_get_vm_id, vm_names):
+            if vm_id:
+                vm_list.append({"id": str(vm_id)})
+
+    return vm_list
+
+
+def _with_etag(pipeline_response, deserialized, headers):  # pylint: disable=unused-argument
+    """
+    Response hook returning the availability set as a dictionary, including the ETag header if the service
+    sent one.
+    """
+    result = deserialized.as_dict()
+    etag = pipeline_response.http_response.headers.get("ETag")
+    if etag:
+        result["etag"] = etag
+    return result
+
 
 def create_or_update(name, resource_group, **kwargs):
     """
@@ -67,6 +128,18 @@ def create_or_update(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the availability set.
 
+    :param batch_resolve: (Default: True) Resolve the names passed in ``virtual_machines`` by listing the virtual
+        machines of the resource group once instead of getting each of them, if there are three or more.
+
+        .. versionadded:: 4.2.0
+
+    :param if_match: The ETag returned by a previous ``get``, which is sent as an ``If-Match`` header with the
+        update. If the service enforces it, the update fails with an error when the availability set was modified
+        since. The availability sets API does not document ETag support, so the update may also be applied
+        unconditionally.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -87,14 +160,9 @@ def create_or_update(name, resource_group, **kwargs):
 
     # Use VM names to link to the IDs of existing VMs.
     if isinstance(kwargs.get("virtual_machines"), list):
-        vm_list = []
-        for vm_name in kwargs.get("virtual_machines"):
-            vm_instance = __salt__["azurerm_compute_virtual_machine.get"](
-                name=vm_name, resource_group=resource_group, **kwargs
-            )
-            if "error" not in vm_instance:
-                vm_list.append({"id": str(vm_instance["id"])})
-        kwargs["virtual_machines"] = vm_list
+        kwargs["virtual_machines"] = _resolve_virtual_machine_ids(
+            compconn, kwargs["virtual_machines"], resource_group, **kwargs
+        )
 
     try:
         setmodel = saltext.azurerm.utils.azurerm.create_object_model(
@@ -104,13 +172,19 @@ def create_or_update(name, resource_group, **kwargs):
         result = {"error": f"The object model could not be built. ({str(exc)})"}
         return result
 
+    request_kwargs = {}
+    if kwargs.get("if_match"):
+        request_kwargs["headers"] = {"If-Match": kwargs["if_match"]}
+
     try:
-        av_set = compconn.availability_sets.create_or_update(
+        result = compconn.availability_sets.create_or_update(
             resource_group_name=resource_group,
             availability_set_name=name,
             parameters=setmodel,
+            cls=_with_etag,
+            **request_kwargs,
         )
-        result = av_set.as_dict()
+        saltext.azurerm.utils.azurerm.clear_cached_results(resource_group)
 
     except HttpResponseError as exc:
         saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
@@ -146,6 +220,7 @@ def delete(name, resource_group, **kwargs):
             resource_group_name=resource_group, availability_set_name=name
         )
         result = True
+        saltext.azurerm.utils.azurerm.clear_cached_results(resource_group)
     except HttpResponseError as exc:
         saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
         result = {"error": str(exc)}
@@ -157,7 +232,8 @@ def get(name, resource_group, **kwargs):
     """
     .. versionadded:: 2.1.0
 
-    Get a dictionary representing an availability set's properties.
+    Get a dictionary representing an availability set's properties. If the service returns an ETag, it is
+    included as ``etag`` and can be passed as ``if_match`` to ``create_or_update``.
 
     :param name: The availability set to get.
 
@@ -174,10 +250,9 @@ def get(name, resource_group, **kwargs):
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
 
     try:
-        av_set = compconn.availability_sets.get(
-            resource_group_name=resource_group, availability_set_name=name
+        result = compconn.availability_sets.get(
+            resource_group_name=resource_group, availability_set_name=name, cls=_with_etag
         )
-        result = av_set.as_dict()
 
     except (HttpResponseError, ResourceNotFoundError) as exc:
         saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
@@ -186,7 +261,8 @@ def get(name, resource_group, **kwargs):
     return result
 
 
-def list_(resource_group=None, **kwargs):
+@saltext.azurerm.utils.azurerm.cache_result
+def list_(resource_group=None, top=None, **kwargs):
     """
     .. versionadded:: 2.1.0
 
@@ -194,6 +270,11 @@ def list_(resource_group=None, **kwargs):
 
     :param resource_group: The name of the resource group to limit the results.
 
+    :param top: The maximum number of availability sets to return. Once reached, no further pages of results are
+        requested.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -201,17 +282,22 @@ def list_(resource_group=None, **kwargs):
         salt-call azurerm_compute_availability_set.list testgroup
 
     """
+    try:
+        top = saltext.azurerm.utils.azurerm.validate_top(top)
+    except ValueError as exc:
+        return {"error": str(exc)}
+
     result = {}
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
 
     try:
         if resource_group:
-            avail_sets = saltext.azurerm.utils.azurerm.paged_object_to_list(
-                compconn.availability_sets.list(resource_group_name=resource_group)
+            avail_sets = saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+                compconn.availability_sets.list(resource_group_name=resource_group), top=top
             )
         else:
-            avail_sets = saltext.azurerm.utils.azurerm.paged_object_to_list(
-                compconn.availability_sets.list_by_subscription()
+            avail_sets = saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+                compconn.availability_sets.list_by_subscription(), top=top
             )
 
         for avail_set in avail_sets:
@@ -223,6 +309,7 @@ def list_(resource_group=None, **kwargs):
     return result
 
 
+@saltext.azurerm.utils.azurerm.cache_result
 def list_available_sizes(name, resource_group, **kwargs):
     """
     .. versionadded:: 2.1.0
@@ -245,7 +332,7 @@ def list_available_sizes(name, resource_group, **kwargs):
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
 
     try:
-        sizes = saltext.azurerm.utils.azurerm.paged_object_to_list(
+        sizes = saltext.azurerm.utils.azurerm.iter_paged_object(
             compconn.availability_sets.list_available_sizes(
                 resource_group_name=resource_group, availability_set_name=name
             )
@@ -34,16 +34,21 @@ Azure Resource Manager (ARM) Compute Virtual Machine Execution Module
         * ``AZURE_GERMAN_CLOUD``
 """
 # Python libs
+import asyncio
 import logging
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import saltext.azurerm.utils.azurerm
+from salt.exceptions import SaltInvocationError  # pylint: disable=import-error
 
 # Azure libs
 HAS_LIBS = False
 try:
-    import azure.mgmt.compute.models  # pylint: disable=unused-import
+    from azure.mgmt.compute.models import VirtualMachineCaptureParameters
     from azure.core.exceptions import (
+        AzureError,
         ResourceNotFoundError,
         HttpResponseError,
         SerializationError,
@@ -58,6 +63,73 @@ __func_alias__ = {"list_": "list"}
 
 log = logging.getLogger(__name__)
 
+BULK_POWER_ACTIONS = ("deallocate", "power_off", "redeploy", "restart", "start")
+
+# Default number of seconds between status checks of long-running operations
+POLL_INTERVAL = 5
+
+# The authenticated client and call options shared by the operations on virtual machines within a
+# resource group, so that they are resolved once instead of being passed around as keyword arguments
+AuthContext = namedtuple("AuthContext", ["compconn", "resource_group", "polling_interval"])
+
+
+def _auth_context(resource_group, **kwargs):
+    """
+    Build the context for operations on virtual machines within a resource group.
+    """
+    return AuthContext(
+        compconn=saltext.azurerm.utils.azurerm.get_client("compute", **kwargs),
+        resource_group=resource_group,
+        polling_interval=kwargs.get("poll_interval_sec", POLL_INTERVAL),
+    )
+
+
+def _begin_operation(context, operation, name):
+    """
+    Request a long-running operation on a virtual machine and return its poller.
+    """
+    begin_operation = getattr(context.compconn.virtual_machines, f"begin_{operation}")
+
+    return begin_operation(
+        resource_group_name=context.resource_group,
+        vm_name=name,
+        polling_interval=context.polling_interval,
+    )
+
+
+def _wait_for_poller(poller):
+    """
+    Block until a long-running operation completes and return its result or the raised exception.
+    """
+    try:
+        vm_result = poller.result()
+    except AzureError as exc:
+        return exc
+
+    if vm_result is None:
+        return True
+    return vm_result.as_dict()
+
+
+def _vm_lro(operation, name, resource_group, **kwargs):
+    """
+    Perform a long-running operation on a virtual machine and wait for it to complete.
+    """
+    context = _auth_context(resource_group, **kwargs)
+
+    try:
+        poller = _begin_operation(context, operation, name)
+    except AzureError as exc:
+        result = exc
+    else:
+        result = _wait_for_poller(poller)
+
+    if isinstance(result, AzureError):
+        result = {"error": str(result)}
+        saltext.azurerm.utils.azurerm.log_cloud_error("compute", result["error"], **kwargs)
+
+    return result
+
 
 def create_or_update(
     name,
@@ -649,6 +721,7 @@ def create_or_update(
 
         vm.wait()
         result = vm.result().as_dict()
+        saltext.azurerm.utils.azurerm.clear_cached_results(resource_group)
 
         # Extract connection auth values for virtual machine extensions
         auth_kwargs = (
@@ -745,7 +818,7 @@ def create_or_update(
 
                 result["storage_profile"]["disk_encryption"] = True
             except KeyError as exc:
-                log.error("An error occured while trying to enable disk encryption: %s", (str(exc)))
+                log.error("An error occured while trying to enable disk encryption: %s", exc)
                 result["storage_profile"]["disk_encryption"] = False
 
         # Give some more details about the sub-objects
@@ -797,19 +870,18 @@ def delete(
 
     """
     result = False
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
+    context = _auth_context(resource_group, **kwargs)
 
     # pylint: disable=invalid-name
-    vm = __salt__["azurerm_compute_virtual_machine.get"](
-        resource_group=resource_group, name=name, **kwargs
-    )
+    vm = _get(context, name, **kwargs)
 
     try:
-        poller = compconn.virtual_machines.begin_delete(
+        poller = context.compconn.virtual_machines.begin_delete(
             resource_group_name=resource_group, vm_name=name
         )
 
         poller.wait()
+        saltext.azurerm.utils.azurerm.clear_cached_results(resource_group)
 
         if cleanup_disks:
             os_disk = parse_resource_id(
@@ -891,6 +963,10 @@ def capture(
 
     :param overwrite: (Default: False) Overwrite the destination disk in case of conflict.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -898,11 +974,6 @@ def capture(
         salt-call azurerm_compute_virtual_machine.capture testvm testcontainer testgroup
 
     """
-    # pylint: disable=invalid-name
-    VirtualMachineCaptureParameters = getattr(
-        azure.mgmt.compute.models, "VirtualMachineCaptureParameters"
-    )
-
     result = {}
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
     try:
@@ -915,6 +986,7 @@ def capture(
                 destination_container_name=destination_name,
                 overwrite_vhds=overwrite,
             ),
+            polling_interval=kwargs.get("poll_interval_sec", POLL_INTERVAL),
         )
         vm.wait()
         vm_result = vm.result()
@@ -926,6 +998,26 @@ def capture(
     return result
 
 
+def _get(context, name, **kwargs):
+    """
+    Retrieve a virtual machine within the resource group of an existing context.
+    """
+    expand = kwargs.get("expand")
+
+    result = {}
+    try:
+        # pylint: disable=invalid-name
+        vm = context.compconn.virtual_machines.get(
+            resource_group_name=context.resource_group, vm_name=name, expand=expand
+        )
+        result = vm.as_dict()
+    except (HttpResponseError, ResourceNotFoundError) as exc:
+        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
+        result = {"error": str(exc)}
+
+    return result
+
+
 def get(name, resource_group, **kwargs):
     """
     .. versionadded:: 2.1.0
@@ -943,21 +1035,9 @@ def get(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.get testvm testgroup
 
     """
-    expand = kwargs.get("expand")
-
-    result = {}
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.get(
-            resource_group_name=resource_group, vm_name=name, expand=expand
-        )
-        result = vm.as_dict()
-    except (HttpResponseError, ResourceNotFoundError) as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
+    context = _auth_context(resource_group, **kwargs)
 
-    return result
+    return _get(context, name, **kwargs)
 
 
 def assess_patches(name, resource_group, **kwargs):
@@ -1006,6 +1086,10 @@ def convert_to_managed_disks(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1013,20 +1097,7 @@ def convert_to_managed_disks(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.convert_to_managed_disks testvm testgroup
 
     """
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_convert_to_managed_disks(
-            resource_group_name=resource_group, vm_name=name
-        )
-        vm.wait()
-        vm_result = vm.result()
-        result = vm_result.as_dict()
-    except HttpResponseError as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
-
-    return result
+    return _vm_lro("convert_to_managed_disks", name, resource_group, **kwargs)
 
 
 def deallocate(name, resource_group, **kwargs):
@@ -1039,6 +1110,10 @@ def deallocate(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1046,21 +1121,7 @@ def deallocate(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.deallocate testvm testgroup
 
     """
-    result = False
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_deallocate(
-            resource_group_name=resource_group, vm_name=name
-        )
-        vm.wait()
-        result = True
-    except (HttpResponseError, ResourceNotFoundError) as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
-
-    return result
+    return _vm_lro("deallocate", name, resource_group, **kwargs)
 
 
 def generalize(name, resource_group, **kwargs):
@@ -1091,7 +1152,8 @@ def generalize(name, resource_group, **kwargs):
     return result
 
 
-def list_(resource_group=None, **kwargs):
+@saltext.azurerm.utils.azurerm.cache_result
+def list_(resource_group=None, top=None, **kwargs):
     """
     .. versionadded:: 2.1.0
 
@@ -1099,6 +1161,16 @@ def list_(resource_group=None, **kwargs):
 
     :param resource_group: The name of the resource group to limit the results.
 
+    :param top: The maximum number of virtual machines to return. Once reached, no further pages of results are
+        requested.
+
+        .. versionadded:: 4.2.0
+
+    :param filter: An OData filter expression evaluated by Azure, so that only the matching virtual machines are
+        returned. For example, ``"virtualMachineScaleSet/id eq '<scale set resource ID>'"``.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1106,17 +1178,25 @@ def list_(resource_group=None, **kwargs):
         salt-call azurerm_compute_virtual_machine.list testgroup
 
     """
+    try:
+        top = saltext.azurerm.utils.azurerm.validate_top(top)
+    except ValueError as exc:
+        return {"error": str(exc)}
+
     result = {}
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
 
     try:
         if resource_group:
-            vms = saltext.azurerm.utils.azurerm.paged_object_to_list(
-                compconn.virtual_machines.list(resource_group_name=resource_group)
+            vms = saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+                compconn.virtual_machines.list(
+                    resource_group_name=resource_group, filter=kwargs.get("filter")
+                ),
+                top=top,
             )
         else:
-            vms = saltext.azurerm.utils.azurerm.paged_object_to_list(
-                compconn.virtual_machines.list_all(**kwargs)
+            vms = saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+                compconn.virtual_machines.list_all(filter=kwargs.get("filter")), top=top
             )
 
         for vm in vms:  # pylint: disable=invalid-name
@@ -1128,12 +1208,23 @@ def list_(resource_group=None, **kwargs):
     return result
 
 
-def virtual_machines_list_all(**kwargs):
+@saltext.azurerm.utils.azurerm.cache_result
+def virtual_machines_list_all(top=None, **kwargs):
     """
     .. versionadded:: 2.1.0
 
     List all virtual machines within a subscription.
 
+    :param top: The maximum number of virtual machines to return. Once reached, no further pages of results are
+        requested.
+
+        .. versionadded:: 4.2.0
+
+    :param filter: An OData filter expression evaluated by Azure, so that only the matching virtual machines are
+        returned. For example, ``"virtualMachineScaleSet/id eq '<scale set resource ID>'"``.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1141,11 +1232,16 @@ def virtual_machines_list_all(**kwargs):
         salt-call azurerm_compute_virtual_machine.virtual_machines_list_all
 
     """
+    try:
+        top = saltext.azurerm.utils.azurerm.validate_top(top)
+    except ValueError as exc:
+        return {"error": str(exc)}
+
     result = {}
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
     try:
-        vms = saltext.azurerm.utils.azurerm.paged_object_to_list(
-            compconn.virtual_machines.list_all()
+        vms = saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+            compconn.virtual_machines.list_all(filter=kwargs.get("filter")), top=top
         )
         for vm in vms:  # pylint: disable=invalid-name
             result[vm["name"]] = vm
@@ -1188,6 +1284,63 @@ def list_by_location(location, **kwargs):
     return result
 
 
+async def _list_by_resource_groups(resource_groups, **kwargs):
+    """
+    Concurrently list the virtual machines within each of the resource groups specified.
+    """
+
+    async def _list_group(compconn, resource_group):
+        vms = {}
+        async for vm in compconn.virtual_machines.list(  # pylint: disable=invalid-name
+            resource_group_name=resource_group
+        ):
+            vms[vm.name] = vm.as_dict()
+        return vms
+
+    async with saltext.azurerm.utils.azurerm.get_async_client("compute", **kwargs) as compconn:
+        return await asyncio.gather(
+            *[_list_group(compconn, resource_group) for resource_group in resource_groups],
+            return_exceptions=True,
+        )
+
+
+def list_by_resource_groups(resource_groups, **kwargs):
+    """
+    .. versionadded:: 4.2.0
+
+    List all virtual machines within several resource groups. The resource groups are queried concurrently.
+
+    :param resource_groups: A list of resource group names to list virtual machines within.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt-call azurerm_compute_virtual_machine.list_by_resource_groups '["testgroup1", "testgroup2"]'
+
+    """
+    result = {}
+
+    if isinstance(resource_groups, str):
+        resource_groups = [resource_groups]
+
+    try:
+        groups = asyncio.run(_list_by_resource_groups(resource_groups, **kwargs))
+    except (AzureError, ImportError, SaltInvocationError) as exc:
+        # The client could not be built, e.g. due to missing credentials or HTTP transport
+        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
+        return {"error": str(exc)}
+
+    for resource_group, vms in zip(resource_groups, groups):
+        if isinstance(vms, Exception):
+            vms = {"error": str(vms)}
+            saltext.azurerm.utils.azurerm.log_cloud_error("compute", vms["error"], **kwargs)
+        result[resource_group] = vms
+
+    return result
+
+
+@saltext.azurerm.utils.azurerm.cache_result
 def list_available_sizes(name, resource_group, **kwargs):
     """
     .. versionadded:: 2.1.0
@@ -1209,7 +1362,7 @@ def list_available_sizes(name, resource_group, **kwargs):
     compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
 
     try:
-        sizes = saltext.azurerm.utils.azurerm.paged_object_to_list(
+        sizes = saltext.azurerm.utils.azurerm.iter_paged_object(
             compconn.virtual_machines.list_available_sizes(
                 resource_group_name=resource_group, vm_name=name
             )
@@ -1302,6 +1455,10 @@ def power_off(name, resource_group, **kwargs):
     :param resource_group: The resource group name assigned to the
         virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1309,20 +1466,7 @@ def power_off(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.power_off testvm testgroup
 
     """
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_power_off(
-            resource_group_name=resource_group, vm_name=name
-        )
-        vm.wait()
-        vm_result = vm.result()
-        result = vm_result.as_dict()
-    except HttpResponseError as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
-
-    return result
+    return _vm_lro("power_off", name, resource_group, **kwargs)
 
 
 def reapply(name, resource_group, **kwargs):
@@ -1406,6 +1550,10 @@ def restart(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1413,23 +1561,7 @@ def restart(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.restart testvm testgroup
 
     """
-    result = {}
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_restart(
-            resource_group_name=resource_group, vm_name=name
-        )
-
-        vm.wait()
-        vm_result = vm.result()
-        result = vm_result.as_dict()
-    except HttpResponseError as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
-
-    return result
+    return _vm_lro("restart", name, resource_group, **kwargs)
 
 
 def start(name, resource_group, **kwargs):
@@ -1442,6 +1574,10 @@ def start(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1449,20 +1585,7 @@ def start(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.start testvm testgroup
 
     """
-    result = False
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_start(resource_group_name=resource_group, vm_name=name)
-
-        vm.wait()
-        result = True
-    except (HttpResponseError, ResourceNotFoundError) as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
-
-    return result
+    return _vm_lro("start", name, resource_group, **kwargs)
 
 
 def redeploy(name, resource_group, **kwargs):
@@ -1475,6 +1598,10 @@ def redeploy(name, resource_group, **kwargs):
 
     :param resource_group: The resource group name assigned to the virtual machine.
 
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+        .. versionadded:: 4.2.0
+
     CLI Example:
 
     .. code-block:: bash
@@ -1482,19 +1609,73 @@ def redeploy(name, resource_group, **kwargs):
         salt-call azurerm_compute_virtual_machine.redeploy testvm testgroup
 
     """
+    return _vm_lro("redeploy", name, resource_group, **kwargs)
+
+
+def bulk_power_action(names, resource_group, action, wait=True, **kwargs):
+    """
+    .. versionadded:: 4.2.0
+
+    Perform a power action on several virtual machines at once. All of the operations are requested before any of
+    them is waited on, so the virtual machines are transitioned in parallel instead of one after another. Errors
+    are reported per virtual machine and do not abort the remainder of the batch.
+
+    :param names: A list of virtual machine names.
+
+    :param resource_group: The resource group name assigned to the virtual machines.
+
+    :param action: The power action to perform. One of ``deallocate``, ``power_off``, ``redeploy``, ``restart``
+        or ``start``.
+
+    :param wait: (Default: True) Wait for all of the operations to complete. If False, the current status of each
+        operation is returned as soon as all of them have been requested.
+
+    :param poll_interval_sec: (Default: 5) The number of seconds between checks of the operation status.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt-call azurerm_compute_virtual_machine.bulk_power_action '["testvm1", "testvm2"]' testgroup restart
+
+    """
+    if action not in BULK_POWER_ACTIONS:
+        return {
+            "error": f"The action {action} is not supported. Use one of: {', '.join(BULK_POWER_ACTIONS)}."
+        }
+
+    if isinstance(names, str):
+        names = [names]
+
     result = {}
-    compconn = saltext.azurerm.utils.azurerm.get_client("compute", **kwargs)
-    try:
-        # pylint: disable=invalid-name
-        vm = compconn.virtual_machines.begin_redeploy(
-            resource_group_name=resource_group, vm_name=name
-        )
-        vm.wait()
-        vm_result = vm.result()
-        result = vm_result.as_dict()
-    except HttpResponseError as exc:
-        saltext.azurerm.utils.azurerm.log_cloud_error("compute", str(exc), **kwargs)
-        result = {"error": str(exc)}
+    pollers = {}
+    context = _auth_context(resource_group, **kwargs)
+
+    for name in names:
+        try:
+            pollers[name] = _begin_operation(context, action, name)
+        except AzureError as exc:
+            result[name] = {"error": str(exc)}
+            saltext.azurerm.utils.azurerm.log_cloud_error(
+                "compute", result[name]["error"], **kwargs
+            )
+
+    if not pollers:
+        return result
+
+    if not wait:
+        for name, poller in pollers.items():
+            result[name] = poller.status()
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(32, len(pollers))) as executor:
+        for name, vm_result in zip(pollers, executor.map(_wait_for_poller, pollers.values())):
+            if isinstance(vm_result, AzureError):
+                vm_result = {"error": str(vm_result)}
+                saltext.azurerm.utils.azurerm.log_cloud_error(
+                    "compute", vm_result["error"], **kwargs
+                )
+            result[name] = vm_result
 
     return result
 
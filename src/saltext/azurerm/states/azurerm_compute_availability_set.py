@@ -217,6 +217,10 @@ def present(
     aset_kwargs = kwargs.copy()
     aset_kwargs.update(connection_auth)
 
+    # Ask for the update to be rejected if the availability set changed since it was compared above
+    if "error" not in aset and aset.get("etag"):
+        aset_kwargs["if_match"] = aset["etag"]
+
     aset = __salt__["azurerm_compute_availability_set.create_or_update"](
         name=name,
         resource_group=resource_group,
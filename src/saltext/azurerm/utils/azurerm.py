@@ -6,6 +6,7 @@ Azure Resource Manager Utilities
 :maintainer: <devops@eitr.tech>
 :maturity: new
 :depends:
+    * `aiohttp <https://pypi.python.org/pypi/aiohttp>`_ >= 3.8.1
     * `azure <https://pypi.python.org/pypi/azure>`_ >= 5.0.0
     * `azure-common <https://pypi.python.org/pypi/azure-common>`_ >= 1.1.28
     * `azure-mgmt <https://pypi.python.org/pypi/azure-mgmt>`_ >= 5.0.0
@@ -19,10 +20,20 @@ Azure Resource Manager Utilities
 :platform: linux
 
 """
+import asyncio
+import atexit
+import copy
+import functools
 import importlib
+import inspect
+import itertools
 import logging
 import os
 import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from operator import itemgetter
 
 import salt.config  # pylint: disable=import-error
@@ -44,6 +55,10 @@ try:
         get_cloud_from_metadata_endpoint,
     )
     from azure.core.pipeline.policies import UserAgentPolicy
+    from azure.core.pipeline.transport import RequestsTransport
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 
     HAS_AZURE = True
 except ImportError:
@@ -54,6 +69,46 @@ __salt__ = salt.loader.minion_mods(__opts__)
 
 log = logging.getLogger(__name__)
 
+# Keyword arguments which determine the identity a management client is authenticated as, including
+# the options forwarded to DefaultAzureCredential. Options starting with "exclude_" are always included.
+_CREDENTIAL_KWARGS = (
+    "subscription_id",
+    "tenant",
+    "client_id",
+    "secret",
+    "client_certificate_path",
+    "username",
+    "password",
+    "cloud_environment",
+    "profile",
+    "authority",
+    "managed_identity_client_id",
+    "workload_identity_client_id",
+    "workload_identity_tenant_id",
+    "interactive_browser_client_id",
+    "interactive_browser_tenant_id",
+    "shared_cache_username",
+    "shared_cache_tenant_id",
+    "visual_studio_code_tenant_id",
+    "additionally_allowed_tenants",
+)
+
+# Maximum number of management clients kept in the client cache
+CLIENT_CACHE_SIZE = 32
+
+# Default number of pooled connections kept per host by the shared HTTP sessions
+CONNECTION_POOL_SIZE = 50
+
+# Default number of seconds the results of read-mostly functions are cached for
+RESULT_CACHE_TTL = 30
+
+_CLIENT_CACHE = OrderedDict()
+_CLIENT_CACHE_LOCK = threading.Lock()
+_SESSIONS = {}
+
+_RESULT_CACHE = {}
+_RESULT_CACHE_LOCK = threading.Lock()
+
 
 def __virtual__():
     if not HAS_AZURE:
@@ -122,9 +177,9 @@ def _determine_auth(**kwargs):
     return credentials, subscription_id, cloud_env
 
 
-def get_client(client_type, **kwargs):
+def _get_client_class(client_type, aio=False):
     """
-    Dynamically load the selected client and return a management client object
+    Dynamically load the management client class for the selected client type
     """
     client_map = {
         "compute": "ComputeManagement",
@@ -156,32 +211,225 @@ def get_client(client_type, **kwargs):
     else:
         module_name = client_type
 
+    if aio:
+        module_name += ".aio"
+
     try:
         client_module = importlib.import_module("azure.mgmt." + module_name)
         Client = getattr(client_module, f"{map_value}Client")  # pylint: disable=invalid-name
-    except ImportError:
+    except (AttributeError, ImportError):
         raise SaltSystemExit(  # pylint: disable=raise-missing-from
             f"The azure {client_type} client is not available."
         )
-    credentials, subscription_id, cloud_env = _determine_auth(**kwargs)
 
+    return Client
+
+
+def _build_client(
+    client_class, client_type, credentials, subscription_id, cloud_env, **client_kwargs
+):
+    """
+    Instantiate a management client object with the common Salt parameters
+    """
     user_agent = UserAgentPolicy(f"Salt/{salt.version.__version__}")
     if client_type == "subscription":
-        client = Client(
+        client = client_class(
             credential=credentials,
             base_url=cloud_env.endpoints.resource_manager,
             user_agent_policy=user_agent,
+            **client_kwargs,
         )
     else:
-        client = Client(
+        client = client_class(
             credential=credentials,
             subscription_id=subscription_id,
             base_url=cloud_env.endpoints.resource_manager,
             user_agent_policy=user_agent,
+            **client_kwargs,
         )
     return client
 
 
+def _get_session(pool_size=CONNECTION_POOL_SIZE):
+    """
+    Return the HTTP session shared by all of the cached management clients using the given
+    connection pool size. The requests default of 10 connections per host would otherwise
+    serialize wide concurrent fan-outs against the Azure Resource Manager endpoint.
+    """
+    session = _SESSIONS.get(pool_size)
+
+    if session is None:
+        session = requests.Session()
+        # Retries are handled by the retry policy of the Azure SDK pipeline
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _SESSIONS[pool_size] = session
+
+    return session
+
+
+def _connection_pool_size(**kwargs):
+    """
+    Return the connection pool size requested with the ``connection_pool_size`` keyword argument,
+    falling back to the default if it is not a positive integer
+    """
+    pool_size = kwargs.get("connection_pool_size", CONNECTION_POOL_SIZE)
+
+    try:
+        pool_size = int(pool_size)
+    except (TypeError, ValueError):
+        pool_size = 0
+
+    if pool_size < 1:
+        log.warning(
+            "Invalid connection_pool_size %r, using the default of %s instead.",
+            kwargs["connection_pool_size"],
+            CONNECTION_POOL_SIZE,
+        )
+        pool_size = CONNECTION_POOL_SIZE
+
+    return pool_size
+
+
+def _client_cache_key(client_type, pool_size, **kwargs):
+    """
+    Build a hashable key identifying a management client by its type, connection pool size and
+    credentials
+    """
+    credential_kwargs = sorted(
+        (key, str(value))
+        for key, value in kwargs.items()
+        if key in _CREDENTIAL_KWARGS or key.startswith("exclude_")
+    )
+    return (client_type, pool_size, tuple(credential_kwargs))
+
+
+def _close_client(client):
+    """
+    Close a management client, logging instead of raising any error
+    """
+    try:
+        client.close()
+    except Exception as exc:  # pylint: disable=broad-except
+        log.debug("Unable to close the Azure Resource Manager client: %s", exc)
+
+
+def close_clients():
+    """
+    Close all of the cached management clients and their shared HTTP sessions
+    """
+    with _CLIENT_CACHE_LOCK:
+        for client in _CLIENT_CACHE.values():
+            _close_client(client)
+        _CLIENT_CACHE.clear()
+
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+atexit.register(close_clients)
+
+
+def _reset_after_fork():
+    """
+    Forget the clients, HTTP sessions and locks inherited from the parent process, so that a forked
+    child, e.g. of a parallel salt-cloud run, does not share open TLS connections with its parent or
+    wait on a lock held by a thread which does not exist in the child. The inherited objects are not
+    closed, since their connections are still in use by the parent.
+    """
+    global _CLIENT_CACHE, _CLIENT_CACHE_LOCK, _SESSIONS  # pylint: disable=global-statement
+    global _RESULT_CACHE_LOCK  # pylint: disable=global-statement
+
+    _CLIENT_CACHE = OrderedDict()
+    _CLIENT_CACHE_LOCK = threading.Lock()
+    _SESSIONS = {}
+    _RESULT_CACHE_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client(client_type, **kwargs):
+    """
+    Dynamically load the selected client and return a management client object. Clients are cached
+    per client type and set of credentials, and share a pooled HTTP session, so that subsequent calls
+    reuse established connections instead of performing a new TCP connect and TLS handshake. Once
+    more than ``CLIENT_CACHE_SIZE`` clients are cached, the least recently used one is closed.
+
+    The number of pooled connections per host can be tuned with the ``connection_pool_size``
+    keyword argument (default: 50). Values which are not positive integers are ignored.
+    """
+    client_class = _get_client_class(client_type)
+    pool_size = _connection_pool_size(**kwargs)
+    cache_key = _client_cache_key(client_type, pool_size, **kwargs)
+
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(cache_key)
+        if client is None:
+            credentials, subscription_id, cloud_env = _determine_auth(**kwargs)
+            client = _build_client(
+                client_class,
+                client_type,
+                credentials,
+                subscription_id,
+                cloud_env,
+                transport=RequestsTransport(session=_get_session(pool_size), session_owner=False),
+            )
+            _CLIENT_CACHE[cache_key] = client
+            if len(_CLIENT_CACHE) > CLIENT_CACHE_SIZE:
+                _close_client(_CLIENT_CACHE.popitem(last=False)[1])
+        else:
+            _CLIENT_CACHE.move_to_end(cache_key)
+
+    return client
+
+
+class _AsyncCredential:
+    """
+    Expose a synchronous credential through the interface expected by the asynchronous clients
+    """
+
+    def __init__(self, credential):
+        self._credential = credential
+
+    async def get_token(self, *scopes, **kwargs):
+        # Request tokens in a worker thread, so that the event loop is not blocked meanwhile
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._credential.get_token, *scopes, **kwargs)
+        )
+
+    async def close(self):
+        close = getattr(self._credential, "close", None)
+        if close:
+            close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+def get_async_client(client_type, **kwargs):
+    """
+    Dynamically load the selected client and return an asynchronous management client object. The
+    client should be used as an async context manager so that its connections are closed when done.
+    """
+    client_class = _get_client_class(client_type, aio=True)
+    credentials, subscription_id, cloud_env = _determine_auth(**kwargs)
+
+    return _build_client(
+        client_class, client_type, _AsyncCredential(credentials), subscription_id, cloud_env
+    )
+
+
 def log_cloud_error(client, message, **kwargs):
     """
     Log an azurerm cloud error exception
@@ -200,19 +448,155 @@ def log_cloud_error(client, message, **kwargs):
     return
 
 
+def validate_top(top):
+    """
+    Return the maximum number of items to list as an integer, or None if it is not specified. A
+    ValueError is raised if it is not a non-negative integer.
+    """
+    if top is None:
+        return None
+
+    try:
+        top = int(top)
+    except (TypeError, ValueError):
+        top = -1
+
+    if top < 0:
+        raise ValueError("The top parameter must be a non-negative integer.")
+
+    return top
+
+
+def iter_paged_object(paged_object, top=None):
+    """
+    Lazily yield the items within a paged object as dictionaries. Further pages are only requested
+    once the items of the previous page have been consumed. If ``top`` is specified, iteration stops
+    after that many items and any remaining pages are never requested.
+    """
+    if top is not None:
+        paged_object = itertools.islice(paged_object, int(top))
+
+    for item in paged_object:
+        if hasattr(item, "as_dict"):
+            yield item.as_dict()
+        else:
+            yield item
+
+
+def iter_paged_object_prefetch(paged_object, top=None):
+    """
+    Lazily yield the items within a paged object as dictionaries, like ``iter_paged_object``, but
+    request the next page in the background while the items of the current page are consumed. Paged
+    objects which cannot be iterated by page are iterated as usual.
+    """
+    if not hasattr(paged_object, "by_page") or top is not None and int(top) == 0:
+        yield from iter_paged_object(paged_object, top=top)
+        return
+
+    pages = paged_object.by_page()
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, pages, None)
+
+        while True:
+            page = future.result()
+            if page is None:
+                return
+
+            page = list(page)
+            # Only prefetch if the items of the next page may still be needed
+            if top is None or count + len(page) < int(top):
+                future = executor.submit(next, pages, None)
+            else:
+                page = page[: int(top) - count]
+                future = None
+
+            for item in iter_paged_object(page):
+                yield item
+                count += 1
+
+            if future is None:
+                return
+
+
 def paged_object_to_list(paged_object):
     """
     Extract all pages within a paged object as a list of dictionaries
     """
-    paged_return = []
-    while True:
-        try:
-            page = next(paged_object)
-            paged_return.append(page.as_dict())
-        except StopIteration:
-            break
+    return list(iter_paged_object(paged_object))
 
-    return paged_return
+
+def cache_result(func):
+    """
+    Decorator caching the successful results of a read-mostly function for ``azurerm_cache_ttl``
+    seconds, as set in the configuration of the module defining the function (default: 30). A value
+    of 0 disables the cache. Results are cached per set of arguments and copied on return, so callers
+    may modify them.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # The loader injects the configuration of the calling minion, proxy or cloud into the module
+        opts = func.__globals__.get("__opts__", __opts__)
+        ttl = opts.get("azurerm_cache_ttl", RESULT_CACHE_TTL)
+        if not ttl:
+            return func(*args, **kwargs)
+
+        arguments = inspect.signature(func).bind_partial(*args, **kwargs).arguments
+        arguments.update(
+            (k, v) for k, v in arguments.pop("kwargs", {}).items() if not k.startswith("__pub_")
+        )
+        key = (func.__module__, func.__name__, repr(sorted(arguments.items())))
+        now = time.monotonic()
+
+        with _RESULT_CACHE_LOCK:
+            entry = _RESULT_CACHE.get(key)
+        if entry and entry[0] > now:
+            return copy.deepcopy(entry[2])
+
+        result = func(*args, **kwargs)
+
+        if not (isinstance(result, dict) and "error" in result):
+            with _RESULT_CACHE_LOCK:
+                # Drop expired results, so that the cache does not grow in long-running processes
+                for stale_key in [k for k, v in _RESULT_CACHE.items() if v[0] <= now]:
+                    del _RESULT_CACHE[stale_key]
+                _RESULT_CACHE[key] = (
+                    now + ttl,
+                    arguments.get("resource_group"),
+                    copy.deepcopy(result),
+                )
+
+        return result
+
+    return wrapper
+
+
+def clear_cached_results(resource_group=None):
+    """
+    Remove cached results which may be affected by a change within the resource group specified.
+    Results which were not limited to a resource group are always removed. If no resource group is
+    specified, the whole cache is cleared.
+    """
+    with _RESULT_CACHE_LOCK:
+        if resource_group is None:
+            _RESULT_CACHE.clear()
+            return
+
+        for key, entry in list(_RESULT_CACHE.items()):
+            if entry[1] is None or str(entry[1]).lower() == str(resource_group).lower():
+                del _RESULT_CACHE[key]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_model_class(module_name, object_name):
+    """
+    Load a model class from the models of an Azure management module. The classes are cached, since
+    objects are assembled recursively and repeatedly from the same models.
+    """
+    model_module = importlib.import_module(f"azure.mgmt.{module_name}.models")
+    return getattr(model_module, object_name)
 
 
 def create_object_model(module_name, object_name, **kwargs):
@@ -222,9 +606,8 @@ def create_object_model(module_name, object_name, **kwargs):
     object_kwargs = {}
 
     try:
-        model_module = importlib.import_module(f"azure.mgmt.{module_name}.models")
         # pylint: disable=invalid-name
-        Model = getattr(model_module, object_name)
+        Model = _get_model_class(module_name, object_name)
     except ImportError:
         raise sys.exit(  # pylint: disable=raise-missing-from
             f"The {object_name} model in the {module_name} Azure module is not available."
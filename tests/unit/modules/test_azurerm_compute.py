@@ -0,0 +1,42 @@
+import inspect
+import re
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import saltext.azurerm.modules.azurerm_compute as azurerm_compute
+import saltext.azurerm.modules.azurerm_compute_availability_set as azurerm_compute_availability_set
+import saltext.azurerm.modules.azurerm_compute_virtual_machine as azurerm_compute_virtual_machine
+
+
+def _loader_functions(module):
+    """
+    Return the names under which the loader exposes the public functions of a module
+    """
+    aliases = getattr(module, "__func_alias__", {})
+    return {
+        aliases.get(name, name)
+        for name, func in inspect.getmembers(module, inspect.isfunction)
+        if not name.startswith("_") and func.__module__ == module.__name__
+    }
+
+
+def test_forwarded_functions_exist():
+    modules = {
+        "azurerm_compute_availability_set": azurerm_compute_availability_set,
+        "azurerm_compute_virtual_machine": azurerm_compute_virtual_machine,
+    }
+    targets = re.findall(r'__salt__\["(\w+)\.(\w+)"\]', inspect.getsource(azurerm_compute))
+
+    assert targets
+    for module_name, function in targets:
+        assert function in _loader_functions(modules[module_name]), f"{module_name}.{function}"
+
+
+def test_virtual_machines_list_all():
+    list_all = MagicMock(return_value={})
+    salt_mock = {"azurerm_compute_virtual_machine.virtual_machines_list_all": list_all}
+
+    with patch.object(azurerm_compute, "__salt__", salt_mock, create=True):
+        azurerm_compute.virtual_machines_list_all(top=5, filter="name eq 'vm1'")
+
+    list_all.assert_called_once_with(top=5, filter="name eq 'vm1'")
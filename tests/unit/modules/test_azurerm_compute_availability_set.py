@@ -0,0 +1,162 @@
+import json
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import requests
+import saltext.azurerm.modules.azurerm_compute_availability_set as azurerm_compute_availability_set
+from azure.core.credentials import AccessToken
+from azure.core.exceptions import HttpResponseError
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import HttpTransport
+from azure.core.pipeline.transport import RequestsTransportResponse
+from azure.mgmt.compute import ComputeManagementClient
+
+
+def _vm(name):
+    vm = MagicMock()
+    vm.name = name
+    vm.id = f"/subscriptions/1234/resourceGroups/testgroup/virtualMachines/{name}"
+    return vm
+
+
+@pytest.fixture()
+def compconn():
+    vms = {name: _vm(name) for name in ("vm1", "VM2", "vm3")}
+
+    def get_vm(resource_group_name, vm_name):  # pylint: disable=unused-argument
+        if vm_name not in vms:
+            raise ResourceNotFoundError(f"{vm_name} not found")
+        return vms[vm_name]
+
+    compconn = MagicMock()
+    compconn.virtual_machines.list.return_value = list(vms.values())
+    compconn.virtual_machines.get.side_effect = get_vm
+    return compconn
+
+
+def _resolve(compconn, vm_names, **kwargs):
+    # pylint: disable=protected-access
+    return azurerm_compute_availability_set._resolve_virtual_machine_ids(
+        compconn, vm_names, "testgroup", **kwargs
+    )
+
+
+def test_resolve_virtual_machine_ids_batch(compconn):
+    result = _resolve(compconn, ["vm1", "vm2", "Vm3", "vm4"])
+
+    assert [vm["id"].split("/")[-1] for vm in result] == ["vm1", "VM2", "vm3"]
+    compconn.virtual_machines.list.assert_called_once_with(resource_group_name="testgroup")
+    compconn.virtual_machines.get.assert_not_called()
+
+
+def test_resolve_virtual_machine_ids_below_threshold(compconn):
+    result = _resolve(compconn, ["vm1", "vm4"])
+
+    assert [vm["id"].split("/")[-1] for vm in result] == ["vm1"]
+    compconn.virtual_machines.list.assert_not_called()
+    assert compconn.virtual_machines.get.call_count == 2
+
+
+def test_resolve_virtual_machine_ids_batch_disabled(compconn):
+    result = _resolve(compconn, ["vm1", "VM2", "vm3"], batch_resolve=False)
+
+    assert [vm["id"].split("/")[-1] for vm in result] == ["vm1", "VM2", "vm3"]
+    compconn.virtual_machines.list.assert_not_called()
+    assert compconn.virtual_machines.get.call_count == 3
+
+
+def test_resolve_virtual_machine_ids_batch_fallback(compconn):
+    compconn.virtual_machines.list.side_effect = HttpResponseError("forbidden")
+
+    result = _resolve(compconn, ["vm1", "VM2", "vm3", "vm4"])
+
+    assert [vm["id"].split("/")[-1] for vm in result] == ["vm1", "VM2", "vm3"]
+    assert compconn.virtual_machines.get.call_count == 4
+
+
+def test_resolve_virtual_machine_ids_empty(compconn):
+    assert not _resolve(compconn, [])
+    compconn.virtual_machines.list.assert_not_called()
+    compconn.virtual_machines.get.assert_not_called()
+
+
+class FakeTransport(HttpTransport):
+    """
+    Transport recording the requests sent and returning a canned response
+    """
+
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.body = body or {}
+        self.requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers.update(self.headers)
+        response._content = json.dumps(self.body).encode()  # pylint: disable=protected-access
+        return RequestsTransportResponse(request, response)
+
+
+@pytest.fixture()
+def transport():
+    class FakeCredential:
+        def get_token(self, *scopes, **kwargs):  # pylint: disable=unused-argument
+            return AccessToken("fake_token", 2527537086)
+
+    transport = FakeTransport(
+        headers={"ETag": 'W/"1"'}, body={"name": "testset", "location": "westus"}
+    )
+    client = ComputeManagementClient(FakeCredential(), "1234", transport=transport)
+    with patch("saltext.azurerm.utils.azurerm.get_client", return_value=client):
+        yield transport
+
+
+def test_get_etag(transport):
+    result = azurerm_compute_availability_set.get("testset", "testgroup")
+    assert result == {"name": "testset", "location": "westus", "etag": 'W/"1"'}
+
+    transport.headers = {}
+    result = azurerm_compute_availability_set.get("testset", "testgroup")
+    assert "etag" not in result
+
+
+def test_create_or_update_if_match(transport):
+    result = azurerm_compute_availability_set.create_or_update(
+        "testset", "testgroup", location="westus", if_match='W/"1"'
+    )
+
+    assert result["etag"] == 'W/"1"'
+    assert transport.requests[-1].method == "PUT"
+    assert transport.requests[-1].headers["If-Match"] == 'W/"1"'
+
+    azurerm_compute_availability_set.create_or_update("testset", "testgroup", location="westus")
+    assert "If-Match" not in transport.requests[-1].headers
+
+
+def test_create_or_update_if_match_precondition_failed(transport):
+    transport.status_code = 412
+    transport.body = {
+        "error": {"code": "PreconditionFailed", "message": "The ETag does not match."}
+    }
+
+    result = azurerm_compute_availability_set.create_or_update(
+        "testset", "testgroup", location="westus", if_match='W/"0"'
+    )
+
+    assert "PreconditionFailed" in result["error"]
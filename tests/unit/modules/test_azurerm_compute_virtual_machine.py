@@ -0,0 +1,259 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+import saltext.azurerm.modules.azurerm_compute_virtual_machine as azurerm_compute_virtual_machine
+import saltext.azurerm.utils.azurerm
+from azure.core.exceptions import HttpResponseError
+from azure.core.exceptions import ServiceRequestError
+from salt.exceptions import SaltInvocationError
+
+
+@pytest.fixture()
+def compconn():
+    compconn = MagicMock()
+    with patch("saltext.azurerm.utils.azurerm.get_client", return_value=compconn):
+        yield compconn
+
+
+@pytest.fixture(autouse=True)
+def clear_cached_results():
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+    yield
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+
+
+def _poller(result=None, exc=None, status="Succeeded"):
+    poller = MagicMock()
+    poller.status.return_value = status
+    if exc:
+        poller.result.side_effect = exc
+    else:
+        poller.result.return_value = result
+    return poller
+
+
+def test_bulk_power_action_unsupported_action(compconn):
+    result = azurerm_compute_virtual_machine.bulk_power_action(["vm1"], "testgroup", "reboot")
+    assert "error" in result
+    compconn.virtual_machines.begin_restart.assert_not_called()
+
+
+def test_bulk_power_action(compconn):
+    compconn.virtual_machines.begin_restart.side_effect = [_poller(), _poller()]
+
+    result = azurerm_compute_virtual_machine.bulk_power_action(
+        ["vm1", "vm2"], "testgroup", "restart", poll_interval_sec=1
+    )
+
+    assert result == {"vm1": True, "vm2": True}
+    compconn.virtual_machines.begin_restart.assert_any_call(
+        resource_group_name="testgroup", vm_name="vm1", polling_interval=1
+    )
+
+
+def test_bulk_power_action_begin_failure(compconn):
+    compconn.virtual_machines.begin_start.side_effect = [
+        HttpResponseError("conflict"),
+        ServiceRequestError("connection failed"),
+        _poller(),
+    ]
+
+    result = azurerm_compute_virtual_machine.bulk_power_action(
+        ["vm1", "vm2", "vm3"], "testgroup", "start"
+    )
+
+    assert result["vm1"] == {"error": "conflict"}
+    assert result["vm2"] == {"error": "connection failed"}
+    assert result["vm3"] is True
+
+
+def test_bulk_power_action_poll_failure(compconn):
+    compconn.virtual_machines.begin_deallocate.side_effect = [
+        _poller(),
+        _poller(exc=ServiceRequestError("connection failed")),
+        _poller(exc=HttpResponseError("failed")),
+    ]
+
+    result = azurerm_compute_virtual_machine.bulk_power_action(
+        ["vm1", "vm2", "vm3"], "testgroup", "deallocate"
+    )
+
+    assert result == {
+        "vm1": True,
+        "vm2": {"error": "connection failed"},
+        "vm3": {"error": "failed"},
+    }
+
+
+def test_bulk_power_action_no_wait(compconn):
+    pollers = [_poller(status="InProgress"), _poller(status="InProgress")]
+    compconn.virtual_machines.begin_power_off.side_effect = pollers
+
+    result = azurerm_compute_virtual_machine.bulk_power_action(
+        "vm1", "testgroup", "power_off", wait=False
+    )
+
+    assert result == {"vm1": "InProgress"}
+    pollers[0].result.assert_not_called()
+
+
+def test_list_by_resource_groups():
+    class AsyncPaged:
+        def __init__(self, items):
+            self._items = iter(items)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                item = next(self._items)
+            except StopIteration:
+                raise StopAsyncIteration  # pylint: disable=raise-missing-from
+            if isinstance(item, Exception):
+                raise item
+            return item
+
+    def vm(name):
+        ret = MagicMock()
+        ret.name = name
+        ret.as_dict.return_value = {"name": name}
+        return ret
+
+    pages = {
+        "group1": [vm("vm1"), vm("vm2")],
+        "group2": [HttpResponseError("not found")],
+        "group3": [ServiceRequestError("connection failed")],
+    }
+    compconn = MagicMock()
+    compconn.__aenter__.return_value = compconn
+    compconn.virtual_machines.list.side_effect = lambda resource_group_name: AsyncPaged(
+        pages[resource_group_name]
+    )
+
+    with patch("saltext.azurerm.utils.azurerm.get_async_client", return_value=compconn):
+        result = azurerm_compute_virtual_machine.list_by_resource_groups(
+            ["group1", "group2", "group3"]
+        )
+
+    assert result == {
+        "group1": {"vm1": {"name": "vm1"}, "vm2": {"name": "vm2"}},
+        "group2": {"error": "not found"},
+        "group3": {"error": "connection failed"},
+    }
+
+
+@pytest.mark.parametrize("top", ["five", -1])
+def test_list_invalid_top(compconn, top):
+    result = azurerm_compute_virtual_machine.list_("testgroup", top=top)
+    assert "error" in result
+    compconn.virtual_machines.list.assert_not_called()
+
+
+def test_get(compconn):
+    compconn.virtual_machines.get.return_value.as_dict.return_value = {"name": "vm1"}
+
+    assert azurerm_compute_virtual_machine.get("vm1", "testgroup") == {"name": "vm1"}
+    compconn.virtual_machines.get.assert_called_once_with(
+        resource_group_name="testgroup", vm_name="vm1", expand=None
+    )
+
+    compconn.virtual_machines.get.side_effect = HttpResponseError("not found")
+    assert azurerm_compute_virtual_machine.get("vm1", "testgroup") == {"error": "not found"}
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        SaltInvocationError("A subscription_id must be specified"),
+        ImportError("No module named aiohttp"),
+    ],
+)
+def test_list_by_resource_groups_client_error(exc):
+    with patch("saltext.azurerm.utils.azurerm.get_async_client", side_effect=exc):
+        result = azurerm_compute_virtual_machine.list_by_resource_groups(["group1", "group2"])
+
+    assert result == {"error": str(exc)}
+
+
+def _vm(name):
+    vm = MagicMock()
+    vm.as_dict.return_value = {"name": name}
+    return vm
+
+
+def test_list_filter(compconn):
+    compconn.virtual_machines.list.return_value = [_vm("vm1")]
+    compconn.virtual_machines.list_all.return_value = [_vm("vm2")]
+    vm_filter = "virtualMachineScaleSet/id eq 'scaleset'"
+
+    result = azurerm_compute_virtual_machine.list_(
+        "testgroup", filter=vm_filter, subscription_id="1234"
+    )
+    assert result == {"vm1": {"name": "vm1"}}
+    compconn.virtual_machines.list.assert_called_once_with(
+        resource_group_name="testgroup", filter=vm_filter
+    )
+
+    result = azurerm_compute_virtual_machine.list_(filter=vm_filter, subscription_id="1234")
+    assert result == {"vm2": {"name": "vm2"}}
+    compconn.virtual_machines.list_all.assert_called_once_with(filter=vm_filter)
+
+
+def test_virtual_machines_list_all(compconn):
+    compconn.virtual_machines.list_all.return_value = [_vm("vm1"), _vm("vm2"), _vm("vm3")]
+
+    result = azurerm_compute_virtual_machine.virtual_machines_list_all(
+        top=2, subscription_id="1234", client_id="abcd", secret="secret", tenant="tenant"
+    )
+    assert result == {"vm1": {"name": "vm1"}, "vm2": {"name": "vm2"}}
+    # only the filter is passed to the operation, never the credentials
+    compconn.virtual_machines.list_all.assert_called_once_with(filter=None)
+
+    azurerm_compute_virtual_machine.virtual_machines_list_all(filter="name eq 'vm1'")
+    compconn.virtual_machines.list_all.assert_called_with(filter="name eq 'vm1'")
+
+
+def test_restart(compconn):
+    compconn.virtual_machines.begin_restart.return_value = _poller()
+
+    assert azurerm_compute_virtual_machine.restart("vm1", "testgroup", poll_interval_sec=2) is True
+    compconn.virtual_machines.begin_restart.assert_called_once_with(
+        resource_group_name="testgroup", vm_name="vm1", polling_interval=2
+    )
+
+
+def test_restart_result(compconn):
+    compconn.virtual_machines.begin_restart.return_value = _poller(result=_vm("vm1"))
+
+    assert azurerm_compute_virtual_machine.restart("vm1", "testgroup") == {"name": "vm1"}
+    compconn.virtual_machines.begin_restart.assert_called_once_with(
+        resource_group_name="testgroup",
+        vm_name="vm1",
+        polling_interval=azurerm_compute_virtual_machine.POLL_INTERVAL,
+    )
+
+
+@pytest.mark.parametrize(
+    "begin_exc,poll_exc",
+    [(HttpResponseError("conflict"), None), (None, ServiceRequestError("conflict"))],
+)
+def test_restart_error(compconn, begin_exc, poll_exc):
+    if begin_exc:
+        compconn.virtual_machines.begin_restart.side_effect = begin_exc
+    else:
+        compconn.virtual_machines.begin_restart.return_value = _poller(exc=poll_exc)
+
+    assert azurerm_compute_virtual_machine.restart("vm1", "testgroup") == {"error": "conflict"}
+
+
+def test_capture(compconn):
+    compconn.virtual_machines.begin_capture.return_value = _poller(result=_vm("vm1"))
+
+    result = azurerm_compute_virtual_machine.capture(
+        "vm1", "testcontainer", "testgroup", poll_interval_sec=2
+    )
+
+    assert result == {"name": "vm1"}
+    assert compconn.virtual_machines.begin_capture.call_args.kwargs["polling_interval"] == 2
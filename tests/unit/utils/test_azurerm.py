@@ -1,9 +1,12 @@
+import asyncio
 import os
+import threading
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
 import saltext.azurerm.utils.azurerm
+from azure.core.paging import ItemPaged
 from azure.mgmt.resource.resources import ResourceManagementClient
 
 try:
@@ -98,6 +101,171 @@ def test_get_client(client_type, client_object, mock_determine_auth):
             assert f"{client_object}Client" in str(client)
 
 
+def test_get_client_cache(mock_determine_auth):
+    saltext.azurerm.utils.azurerm.close_clients()
+
+    with patch("saltext.azurerm.utils.azurerm._determine_auth", mock_determine_auth):
+        client = saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1234")
+        assert saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1234") is client
+        assert mock_determine_auth.call_count == 1
+
+        other = saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="5678")
+        assert other is not client
+        assert mock_determine_auth.call_count == 2
+
+        # pylint: disable=protected-access
+        assert (
+            client._client._pipeline._transport.session
+            is other._client._pipeline._transport.session
+        )
+
+        sized = saltext.azurerm.utils.azurerm.get_client(
+            "compute", subscription_id="1234", connection_pool_size=5
+        )
+        assert sized is not client
+        adapter = sized._client._pipeline._transport.session.get_adapter("https://localhost")
+        assert adapter._pool_maxsize == 5
+        adapter = client._client._pipeline._transport.session.get_adapter("https://localhost")
+        assert adapter._pool_maxsize == 50
+
+    saltext.azurerm.utils.azurerm.close_clients()
+    assert not saltext.azurerm.utils.azurerm._CLIENT_CACHE  # pylint: disable=protected-access
+
+
+@pytest.mark.parametrize(
+    "pool_size,expected", [(None, 50), (5, 5), ("5", 5), ("abc", 50), (0, 50), (-1, 50)]
+)
+def test_connection_pool_size(pool_size, expected):
+    kwargs = {} if pool_size is None else {"connection_pool_size": pool_size}
+    # pylint: disable=protected-access
+    assert saltext.azurerm.utils.azurerm._connection_pool_size(**kwargs) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not available")
+def test_get_client_cache_fork(mock_determine_auth):
+    saltext.azurerm.utils.azurerm.close_clients()
+
+    with patch("saltext.azurerm.utils.azurerm._determine_auth", mock_determine_auth):
+        client = saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1234")
+        # pylint: disable=protected-access
+        session = client._client._pipeline._transport.session
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child_client = saltext.azurerm.utils.azurerm.get_client(
+                    "compute", subscription_id="1234"
+                )
+                fresh = (
+                    child_client is not client
+                    and child_client._client._pipeline._transport.session is not session
+                    and not saltext.azurerm.utils.azurerm._CLIENT_CACHE_LOCK.locked()
+                )
+                os.write(write_fd, b"1" if fresh else b"0")
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        with os.fdopen(read_fd, "rb") as child_result:
+            assert child_result.read() == b"1"
+
+        # the parent keeps its clients
+        assert saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1234") is client
+
+    saltext.azurerm.utils.azurerm.close_clients()
+
+
+def test_get_client_cache_identity(mock_determine_auth):
+    saltext.azurerm.utils.azurerm.close_clients()
+
+    with patch("saltext.azurerm.utils.azurerm._determine_auth", mock_determine_auth):
+        client = saltext.azurerm.utils.azurerm.get_client(
+            "compute", subscription_id="1234", managed_identity_client_id="abc"
+        )
+        other = saltext.azurerm.utils.azurerm.get_client(
+            "compute", subscription_id="1234", managed_identity_client_id="def"
+        )
+        assert other is not client
+
+        # arguments of the calling function do not affect the identity
+        assert (
+            saltext.azurerm.utils.azurerm.get_client(
+                "compute",
+                subscription_id="1234",
+                managed_identity_client_id="abc",
+                resource_group="testgroup",
+            )
+            is client
+        )
+        assert mock_determine_auth.call_count == 2
+
+    saltext.azurerm.utils.azurerm.close_clients()
+
+
+def test_get_client_cache_size(mock_determine_auth):
+    saltext.azurerm.utils.azurerm.close_clients()
+
+    with patch("saltext.azurerm.utils.azurerm._determine_auth", mock_determine_auth), patch(
+        "saltext.azurerm.utils.azurerm.CLIENT_CACHE_SIZE", 2
+    ):
+        first = saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1")
+        saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="2")
+        # using the first client again makes the second one the least recently used
+        assert saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1") is first
+        saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="3")
+
+        # pylint: disable=protected-access
+        assert len(saltext.azurerm.utils.azurerm._CLIENT_CACHE) == 2
+        assert saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="1") is first
+        assert mock_determine_auth.call_count == 3
+        saltext.azurerm.utils.azurerm.get_client("compute", subscription_id="2")
+        assert mock_determine_auth.call_count == 4
+
+    saltext.azurerm.utils.azurerm.close_clients()
+
+
+@pytest.mark.parametrize(
+    "client_type,client_object",
+    [
+        ("compute", "ComputeManagement"),
+        ("dns", "DnsManagement"),
+        ("network", "NetworkManagement"),
+    ],
+)
+def test_get_async_client(client_type, client_object, mock_determine_auth):
+    with patch("saltext.azurerm.utils.azurerm._determine_auth", mock_determine_auth):
+        client = saltext.azurerm.utils.azurerm.get_async_client(client_type)
+        assert f"{client_object}Client" in str(client)
+        assert ".aio." in str(client)
+
+    with pytest.raises(SaltSystemExit):
+        saltext.azurerm.utils.azurerm.get_async_client("NOT_THERE")
+
+
+def test_async_credential(credentials):
+    # pylint: disable=protected-access
+    async_credential = saltext.azurerm.utils.azurerm._AsyncCredential(credentials)
+    token = asyncio.run(async_credential.get_token("https://management.azure.com/.default"))
+    assert token.token == "fake_token"
+
+
+def test_async_credential_does_not_block(credentials):
+    threads = []
+    fetch_token = credentials.get_token
+
+    def get_token(*scopes, **kwargs):
+        threads.append(threading.get_ident())
+        return fetch_token(*scopes, **kwargs)
+
+    credentials.get_token = get_token
+    # pylint: disable=protected-access
+    async_credential = saltext.azurerm.utils.azurerm._AsyncCredential(credentials)
+    asyncio.run(async_credential.get_token("https://management.azure.com/.default"))
+    assert threads and threads[0] != threading.get_ident()
+
+
 def test_paged_object_to_list():
     models = ResourceManagementClient.models()
 
@@ -123,6 +291,90 @@ def test_paged_object_to_list():
     ]
 
 
+def test_iter_paged_object():
+    models = ResourceManagementClient.models()
+    fetched = []
+
+    def _r_groups():
+        for location in ("eastus", "westus"):
+            fetched.append(location)
+            yield models.ResourceGroup(location=location)
+
+    paged_iter = saltext.azurerm.utils.azurerm.iter_paged_object(_r_groups())
+
+    assert next(paged_iter) == {"location": "eastus"}
+    assert fetched == ["eastus"]
+    assert list(paged_iter) == [{"location": "westus"}]
+    assert fetched == ["eastus", "westus"]
+
+    fetched.clear()
+    paged_iter = saltext.azurerm.utils.azurerm.iter_paged_object(_r_groups(), top=1)
+    assert list(paged_iter) == [{"location": "eastus"}]
+    assert fetched == ["eastus"]
+
+
+@pytest.mark.parametrize("top,expected", [(None, None), (0, 0), (5, 5), ("5", 5)])
+def test_validate_top(top, expected):
+    assert saltext.azurerm.utils.azurerm.validate_top(top) == expected
+
+
+@pytest.mark.parametrize("top", [-1, "-1", "five", [5]])
+def test_validate_top_invalid(top):
+    with pytest.raises(ValueError):
+        saltext.azurerm.utils.azurerm.validate_top(top)
+
+
+def test_iter_paged_object_prefetch():
+    models = ResourceManagementClient.models()
+    pages = {
+        None: ("page2", ["eastus", "westus"]),
+        "page2": ("page3", ["centralus"]),
+        "page3": (None, ["northeurope"]),
+    }
+    fetched = []
+
+    def _get_next(continuation_token=None):
+        fetched.append(continuation_token)
+        return pages[continuation_token]
+
+    def _extract_data(response):
+        next_link, locations = response
+        return next_link, [models.ResourceGroup(location=location) for location in locations]
+
+    paged_return = list(
+        saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+            ItemPaged(_get_next, _extract_data)
+        )
+    )
+    assert paged_return == [
+        {"location": "eastus"},
+        {"location": "westus"},
+        {"location": "centralus"},
+        {"location": "northeurope"},
+    ]
+    assert fetched == [None, "page2", "page3"]
+
+    # no pages beyond the ones holding the first items are requested
+    fetched.clear()
+    paged_return = list(
+        saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+            ItemPaged(_get_next, _extract_data), top=2
+        )
+    )
+    assert paged_return == [{"location": "eastus"}, {"location": "westus"}]
+    assert fetched == [None]
+
+    # no page at all is requested if no items are needed
+    fetched.clear()
+    paged_return = list(
+        saltext.azurerm.utils.azurerm.iter_paged_object_prefetch(
+            ItemPaged(_get_next, _extract_data), top=0
+        )
+    )
+    assert not paged_return
+    assert not fetched
+
+
 def test_create_object_model():
     obj = saltext.azurerm.utils.azurerm.create_object_model(
         "network",
@@ -242,3 +494,82 @@ def test_get_identity_credentials():
         kwargs["cloud_environment"] = "THIS_CLOUD_IS_FAKE"
         saltext.azurerm.utils.azurerm.get_identity_credentials(**kwargs)
         assert mock_credential.call_args.kwargs["authority"] == "login.microsoftonline.com"
+
+
+def test_cache_result():
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+    mock_list = MagicMock(return_value={"vm1": {"name": "vm1"}})
+
+    @saltext.azurerm.utils.azurerm.cache_result
+    def list_(resource_group=None, **kwargs):
+        return mock_list(resource_group, **kwargs)
+
+    with patch.dict(saltext.azurerm.utils.azurerm.__opts__, {"azurerm_cache_ttl": 30}):
+        assert list_("group1", subscription_id="1234") == {"vm1": {"name": "vm1"}}
+        list_("group1", subscription_id="1234")["vm1"]["name"] = "modified"
+        assert list_(resource_group="group1", subscription_id="1234") == {"vm1": {"name": "vm1"}}
+        assert mock_list.call_count == 1
+
+        list_("group2", subscription_id="1234")
+        list_(subscription_id="1234")
+        list_(subscription_id="5678")
+        assert mock_list.call_count == 4
+
+        # only results for the changed resource group or the whole subscription are removed
+        saltext.azurerm.utils.azurerm.clear_cached_results("group2")
+        list_("group1", subscription_id="1234")
+        list_("group2", subscription_id="1234")
+        list_(subscription_id="1234")
+        assert mock_list.call_count == 6
+
+        # errors are never cached
+        mock_list.return_value = {"error": "failed"}
+        list_("group3", subscription_id="1234")
+        list_("group3", subscription_id="1234")
+        assert mock_list.call_count == 8
+
+    with patch.dict(saltext.azurerm.utils.azurerm.__opts__, {"azurerm_cache_ttl": 0}):
+        mock_list.return_value = {}
+        list_("group1", subscription_id="1234")
+        assert mock_list.call_count == 9
+
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+
+
+def test_cache_result_module_opts():
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+    mock_list = MagicMock(return_value={"vm1": {"name": "vm1"}})
+
+    @saltext.azurerm.utils.azurerm.cache_result
+    def list_(resource_group=None, **kwargs):
+        return mock_list(resource_group, **kwargs)
+
+    # the configuration of the module defining the function takes precedence
+    with patch.dict(saltext.azurerm.utils.azurerm.__opts__, {"azurerm_cache_ttl": 30}):
+        with patch.dict(globals(), {"__opts__": {"azurerm_cache_ttl": 0}}):
+            list_("group1", subscription_id="1234")
+            list_("group1", subscription_id="1234")
+            assert mock_list.call_count == 2
+
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+
+
+def test_cache_result_evicts_expired():
+    # pylint: disable=protected-access
+    saltext.azurerm.utils.azurerm.clear_cached_results()
+
+    @saltext.azurerm.utils.azurerm.cache_result
+    def list_(resource_group=None, **kwargs):
+        return {}
+
+    with patch.dict(saltext.azurerm.utils.azurerm.__opts__, {"azurerm_cache_ttl": 30}):
+        with patch("time.monotonic", return_value=100):
+            list_("group1")
+            list_("group2")
+        assert len(saltext.azurerm.utils.azurerm._RESULT_CACHE) == 2
+
+        with patch("time.monotonic", return_value=200):
+            list_("group3")
+        assert len(saltext.azurerm.utils.azurerm._RESULT_CACHE) == 1
+
+    saltext.azurerm.utils.azurerm.clear_cached_results()